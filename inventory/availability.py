@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from .models import Product
+
+
+def _product_key(product_id):
+    return f'availability:product:{product_id}'
+
+
+def _sku_key(sku):
+    return f'availability:sku:{sku}'
+
+
+def stock_levels(product_ids=(), skus=()):
+    """Return ``{cache key: {'product', 'sku', 'warehouses': {warehouse id: quantity}}}``.
+
+    Cache misses are resolved together in one Product/Stock join. Unknown
+    products map to ``None``.
+    """
+    keys = [_product_key(product_id) for product_id in product_ids] + [_sku_key(sku) for sku in skus]
+    timeout = settings.STOCK_AVAILABILITY_CACHE_SECONDS
+    levels = cache.get_many(keys) if timeout else {}
+    missing_ids = [product_id for product_id in product_ids if _product_key(product_id) not in levels]
+    missing_skus = [sku for sku in skus if _sku_key(sku) not in levels]
+    if not missing_ids and not missing_skus:
+        return levels
+
+    found = {}
+    rows = Product.objects.filter(Q(id__in=missing_ids) | Q(sku__in=missing_skus)).order_by().values_list(
+        'id', 'sku', 'stocks__warehouse_id', 'stocks__quantity'
+    )
+    for product_id, sku, warehouse_id, quantity in rows:
+        level = found.setdefault(product_id, {'product': product_id, 'sku': sku, 'warehouses': {}})
+        if warehouse_id is not None:
+            level['warehouses'][warehouse_id] = quantity
+    fetched = {_product_key(product_id): None for product_id in missing_ids}
+    fetched.update({_sku_key(sku): None for sku in missing_skus})
+    for level in found.values():
+        fetched[_product_key(level['product'])] = level
+        fetched[_sku_key(level['sku'])] = level
+    if timeout:
+        cache.set_many(fetched, timeout)
+    levels.update(fetched)
+    return levels
+
+
+def availability(lines):
+    """Availability per requested SKU and per product id, totalled across all warehouses.
+
+    SKUs and product ids are reported in separate maps, since a numeric SKU can
+    look exactly like a product id.
+    """
+    levels = stock_levels(
+        product_ids={line['product'] for line in lines if 'product' in line},
+        skus={line['sku'] for line in lines if 'sku' in line},
+    )
+    result = {'skus': {}, 'products': {}}
+    for line in lines:
+        if 'sku' in line:
+            entries, key, level = result['skus'], line['sku'], levels[_sku_key(line['sku'])]
+        else:
+            entries, key, level = result['products'], str(line['product']), levels[_product_key(line['product'])]
+        if level is None:
+            entries[key] = None
+            continue
+        entry = entries.setdefault(key, {
+            'product': level['product'],
+            'sku': level['sku'],
+            'total': sum(level['warehouses'].values()),
+            'warehouses': {},
+        })
+        if line.get('warehouse') is None:
+            entry['warehouses'].update({str(w): q for w, q in level['warehouses'].items()})
+        else:
+            entry['warehouses'][str(line['warehouse'])] = level['warehouses'].get(line['warehouse'], 0)
+    return result
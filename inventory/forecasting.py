@@ -0,0 +1,75 @@
+from datetime import datetime, time, timedelta
+import numpy as np
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import OrderItem, Stock
+
+_ROW_DTYPE = np.dtype([('warehouse', 'i8'), ('product', 'i8'), ('day', 'i8'), ('units', 'i8')])
+
+
+def load_daily_demand(start, days):
+    """Return ``(keys, demand)``: ``keys`` is an (n, 2) array of (warehouse, product) and
+    ``demand[i, d]`` the units of ``keys[i]`` ordered on day ``start + d``.
+
+    Order lines are summed per key and day by the database, so only one row per
+    active SKU-day crosses the wire.
+    """
+    since = timezone.make_aware(datetime.combine(start, time.min))
+    rows = (
+        OrderItem.objects
+        .filter(order__created_at__gte=since, order__created_at__lt=since + timedelta(days=days),
+                order__warehouse__isnull=False)
+        .exclude(order__status='CANCELLED')
+        .annotate(day=TruncDate('order__created_at'))
+        .values_list('order__warehouse_id', 'product_id', 'day')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    origin = start.toordinal()
+    history = np.fromiter(
+        ((warehouse, product, day.toordinal() - origin, units) for warehouse, product, day, units in rows.iterator(chunk_size=10000)),
+        dtype=_ROW_DTYPE,
+    )
+    if not len(history):
+        return np.empty((0, 2), dtype='i8'), np.zeros((0, days))
+    keys, index = np.unique(np.stack([history['warehouse'], history['product']], axis=1), axis=0, return_inverse=True)
+    demand = np.zeros((len(keys), days))
+    np.add.at(demand, (index.reshape(-1), history['day']), history['units'])
+    return keys.reshape(-1, 2), demand
+
+
+def load_on_hand(keys):
+    """Current stock for each (warehouse, product) row of ``keys``; 0 where there is no Stock row."""
+    stock = np.array(list(Stock.objects.order_by().values_list('warehouse_id', 'product_id', 'quantity')), dtype='i8').reshape(-1, 3)
+    on_hand = np.zeros(len(keys), dtype='i8')
+    if not len(stock) or not len(keys):
+        return on_hand
+    # Join on a packed (warehouse, product) code.
+    width = int(max(stock[:, 1].max(), keys[:, 1].max())) + 1
+    stock_codes = stock[:, 0] * width + stock[:, 1]
+    order = np.argsort(stock_codes)
+    stock_codes, quantities = stock_codes[order], stock[order, 2]
+    key_codes = keys[:, 0] * width + keys[:, 1]
+    position = np.minimum(np.searchsorted(stock_codes, key_codes), len(stock_codes) - 1)
+    found = stock_codes[position] == key_codes
+    on_hand[found] = quantities[position[found]]
+    return on_hand
+
+
+def forecast(demand, on_hand, window, alpha, cover_days):
+    """Vectorized demand forecast for every SKU at once.
+
+    Returns the ``window``-day moving average, the exponentially smoothed daily
+    demand, days of cover (``inf`` without demand) and the reorder quantity that
+    brings stock up to ``cover_days`` of smoothed demand.
+    """
+    days = demand.shape[1]
+    moving_average = demand[:, -window:].mean(axis=1)
+    # Closed form of level_t = alpha * x_t + (1 - alpha) * level_{t-1}, seeded with x_0.
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1)
+    smoothed = demand @ weights + (1 - alpha) ** days * demand[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(smoothed > 0, on_hand / smoothed, np.inf)
+    suggested = np.maximum(np.ceil(smoothed * cover_days - on_hand), 0).astype('i8')
+    return moving_average, smoothed, days_of_cover, suggested
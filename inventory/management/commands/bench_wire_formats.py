@@ -0,0 +1,65 @@
+import io
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from inventory.models import Stock, Order, OrderItem
+from inventory.parsers import MessagePackParser
+from inventory.renderers import MessagePackRenderer
+from inventory.serializers import StockSerializer, OrderSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare JSON and MessagePack payload size and encode/decode time for Stock and Order pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per page.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement.')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        formats = [
+            ('json', JSONRenderer(), JSONParser()),
+            ('msgpack', MessagePackRenderer(), MessagePackParser()),
+        ]
+        self.stdout.write(f'{"page":<8}{"format":<10}{"bytes":>12}{"encode ms":>12}{"decode ms":>12}')
+        for name, page in (('stock', self.stock_page(rows)), ('order', self.order_page(rows))):
+            for format_name, renderer, parser in formats:
+                payload = renderer.render(page)
+                encode = self.best_of(repeat, lambda: renderer.render(page))
+                decode = self.best_of(repeat, lambda: parser.parse(io.BytesIO(payload)))
+                self.stdout.write(f'{name:<8}{format_name:<10}{len(payload):>12}{encode:>12.2f}{decode:>12.2f}')
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
+
+    def page(self, results):
+        return {'count': len(results), 'next': None, 'previous': None, 'results': results}
+
+    def stock_page(self, rows):
+        # Unsaved instances: the benchmark measures the wire format, not the database.
+        now = timezone.now()
+        stocks = [
+            Stock(id=i, warehouse_id=i % 20 + 1, product_id=i, quantity=i % 500, last_updated=now, change_seq=i)
+            for i in range(1, rows + 1)
+        ]
+        return self.page(StockSerializer(stocks, many=True).data)
+
+    def order_page(self, rows):
+        now = timezone.now()
+        orders = []
+        for i in range(1, rows + 1):
+            order = Order(id=i, user_id=i % 50 + 1, warehouse_id=i % 20 + 1, status='PENDING', created_at=now, change_seq=i)
+            # Stand in for prefetch_related('items') so serializing needs no queries.
+            order._prefetched_objects_cache = {'items': [
+                OrderItem(id=i * 10 + line, order=order, product_id=line + 1, quantity=line + 1, fulfilled_quantity=0)
+                for line in range(3)
+            ]}
+            orders.append(order)
+        return self.page(OrderSerializer(orders, many=True).data)
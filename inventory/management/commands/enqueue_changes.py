@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from inventory.models import Stock, Order
+from inventory.outbox import record, stock_event, order_event
+
+
+class Command(BaseCommand):
+    help = ('Queue a change event for every stock and order row so delta sync picks them up again. '
+            'Run after writing rows outside the API (shell, raw SQL, data fixes).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unstamped', action='store_true', help='Only rows that have no change_seq yet.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stocks, orders = Stock.objects.order_by('id'), Order.objects.order_by('id')
+        if options['unstamped']:
+            stocks, orders = stocks.filter(change_seq__isnull=True), orders.filter(change_seq__isnull=True)
+        queued = 0
+        for queryset, to_event in ((stocks, stock_event), (orders, lambda order: order_event(order, 'order.updated'))):
+            batch = []
+            for row in queryset.iterator(chunk_size=batch_size):
+                batch.append(to_event(row))
+                if len(batch) >= batch_size:
+                    with transaction.atomic():
+                        record(*batch)
+                    queued += len(batch)
+                    batch = []
+            with transaction.atomic():
+                record(*batch)
+            queued += len(batch)
+        self.stdout.write(f'Queued {queued} change events; relay_outbox will stamp them.')
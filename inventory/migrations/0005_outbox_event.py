@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('stock.changed', 'Stock changed'), ('stock.deleted', 'Stock deleted'), ('order.created', 'Order created'), ('order.updated', 'Order updated'), ('order.deleted', 'Order deleted'), ('order.archived', 'Order archived')], max_length=30)),
+                ('warehouse_id', models.BigIntegerField(blank=True, null=True)),
+                ('product_id', models.BigIntegerField(blank=True, null=True)),
+                ('order_id', models.BigIntegerField(blank=True, null=True)),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('position', models.BigIntegerField(blank=True, null=True, unique=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('position__isnull', True)), fields=['id'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
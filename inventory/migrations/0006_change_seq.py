@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='change_seq',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='change_seq',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_change_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('average_daily_demand', models.FloatField()),
+                ('smoothed_daily_demand', models.FloatField()),
+                ('on_hand', models.PositiveIntegerField()),
+                ('days_of_cover', models.FloatField(blank=True, null=True)),
+                ('suggested_quantity', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestions', to='inventory.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestions', to='inventory.warehouse')),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('warehouse', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+
+def enqueue_existing_rows(apps, schema_editor):
+    # Rows that predate change_seq get one pending outbox event each; the relay then
+    # stamps them so a delta sync from since=0 returns every existing row.
+    Stock = apps.get_model('inventory', 'Stock')
+    Order = apps.get_model('inventory', 'Order')
+    OutboxEvent = apps.get_model('inventory', 'OutboxEvent')
+
+    events = []
+    for stock in Stock.objects.filter(change_seq__isnull=True).order_by('id').iterator(chunk_size=BATCH_SIZE):
+        events.append(OutboxEvent(
+            event_type='stock.changed',
+            warehouse_id=stock.warehouse_id,
+            product_id=stock.product_id,
+            payload={'quantity': stock.quantity},
+        ))
+        if len(events) >= BATCH_SIZE:
+            OutboxEvent.objects.bulk_create(events)
+            events = []
+    for order in Order.objects.filter(change_seq__isnull=True).order_by('id').iterator(chunk_size=BATCH_SIZE):
+        events.append(OutboxEvent(
+            event_type='order.updated',
+            warehouse_id=order.warehouse_id,
+            order_id=order.id,
+            payload={'status': order.status, 'warehouse': order.warehouse_id, 'user': order.user_id},
+        ))
+        if len(events) >= BATCH_SIZE:
+            OutboxEvent.objects.bulk_create(events)
+            events = []
+    OutboxEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_reorder_suggestion'),
+    ]
+
+    operations = [
+        migrations.RunPython(enqueue_existing_rows, migrations.RunPython.noop),
+    ]
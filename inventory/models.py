@@ -28,6 +28,8 @@ class Stock(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stocks')
     quantity = models.PositiveIntegerField(default=0)
     last_updated = models.DateTimeField(auto_now=True)
+    # Feed offset of the last relayed change; the watermark for /api/stocks/changes/.
+    change_seq = models.BigIntegerField(null=True, blank=True, db_index=True)
 
     class Meta:
         unique_together = ('warehouse', 'product')
@@ -42,10 +44,21 @@ class Order(models.Model):
         ('FULFILLED', 'Fulfilled'),
         ('CANCELLED', 'Cancelled'),
     )
+    # Allowed status changes for bulk transitions; FULFILLED and CANCELLED are final.
+    TRANSITIONS = {
+        'PENDING': ('PROCESSING', 'CANCELLED'),
+        'PROCESSING': ('FULFILLED', 'CANCELLED'),
+        'FULFILLED': (),
+        'CANCELLED': (),
+    }
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     warehouse = models.ForeignKey(Warehouse, on_delete=models.SET_NULL,null=True,blank=True, related_name='orders')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
+    change_seq = models.BigIntegerField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['created_at'])]
 
     def __str__(self):
         return f'{self.id} - {self.status}'
@@ -59,3 +72,65 @@ class OrderItem(models.Model):
     def __str__(self):
         return f'{self.product.name} x {self.quantity}'
 
+
+class ArchivedOrder(models.Model):
+    # Cold copy of a closed order; items are kept inline so the hot tables can drop them.
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_orders')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    items = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.id} - {self.status} (archived)'
+
+class OutboxEvent(models.Model):
+    EVENT_CHOICES = (
+        ('stock.changed', 'Stock changed'),
+        ('stock.deleted', 'Stock deleted'),
+        ('order.created', 'Order created'),
+        ('order.updated', 'Order updated'),
+        ('order.deleted', 'Order deleted'),
+        ('order.archived', 'Order archived'),
+    )
+    # Plain ids rather than foreign keys: events must outlive the rows they describe.
+    event_type = models.CharField(max_length=30, choices=EVENT_CHOICES)
+    warehouse_id = models.BigIntegerField(null=True, blank=True)
+    product_id = models.BigIntegerField(null=True, blank=True)
+    order_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Feed offset, assigned by the relay in commit order; null until published.
+    position = models.BigIntegerField(null=True, blank=True, unique=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(position__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type} #{self.id}'
+
+class ReorderSuggestion(models.Model):
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='reorder_suggestions')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reorder_suggestions')
+    average_daily_demand = models.FloatField()
+    smoothed_daily_demand = models.FloatField()
+    on_hand = models.PositiveIntegerField()
+    # Null when there is no forecast demand to cover.
+    days_of_cover = models.FloatField(null=True, blank=True)
+    suggested_quantity = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('warehouse', 'product')
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.product.name} @ {self.warehouse.name}: +{self.suggested_quantity}'
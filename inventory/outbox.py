@@ -0,0 +1,65 @@
+from .models import OutboxEvent, Stock, Order
+
+DELETION_EVENTS = ('stock.deleted', 'order.deleted', 'order.archived')
+
+
+def stock_event(stock, event_type='stock.changed'):
+    return OutboxEvent(
+        event_type=event_type,
+        warehouse_id=stock.warehouse_id,
+        product_id=stock.product_id,
+        payload={'quantity': stock.quantity},
+    )
+
+
+def order_event(order, event_type):
+    return OutboxEvent(
+        event_type=event_type,
+        warehouse_id=order.warehouse_id,
+        order_id=order.id,
+        payload={'status': order.status, 'warehouse': order.warehouse_id, 'user': order.user_id},
+    )
+
+
+def record(*events):
+    """Queue events; call inside the transaction.atomic() block that made the change."""
+    OutboxEvent.objects.bulk_create(events)
+
+
+def compact(events):
+    """Keep only the newest stock event per (warehouse, product); order events are kept as-is."""
+    latest = {}
+    for event in events:
+        if event.event_type.startswith('stock.'):
+            key = ('stock', event.warehouse_id, event.product_id)
+        else:
+            key = ('event', event.id)
+        latest[key] = event
+    return sorted(latest.values(), key=lambda event: event.id)
+
+
+
+def stamp_change_seq(events):
+    """Copy each relayed event's position onto the row it describes, for delta sync."""
+    stock_seq = {
+        (event.warehouse_id, event.product_id): event.position
+        for event in events if event.event_type == 'stock.changed'
+    }
+    order_seq = {
+        event.order_id: event.position
+        for event in events if event.event_type in ('order.created', 'order.updated')
+    }
+    if stock_seq:
+        stocks = Stock.objects.filter(
+            warehouse_id__in={key[0] for key in stock_seq},
+            product_id__in={key[1] for key in stock_seq},
+        ).only('id', 'warehouse_id', 'product_id')
+        stocks = [stock for stock in stocks if (stock.warehouse_id, stock.product_id) in stock_seq]
+        for stock in stocks:
+            stock.change_seq = stock_seq[(stock.warehouse_id, stock.product_id)]
+        Stock.objects.bulk_update(stocks, ['change_seq'], batch_size=1000)
+    if order_seq:
+        orders = list(Order.objects.filter(id__in=order_seq).only('id'))
+        for order in orders:
+            order.change_seq = order_seq[order.id]
+        Order.objects.bulk_update(orders, ['change_seq'], batch_size=1000)
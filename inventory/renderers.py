@@ -0,0 +1,33 @@
+import msgpack
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Same coercions as the JSON renderer: dates, decimals, UUIDs, lazy strings...
+    return _encoder.default(obj)
+
+
+def iter_encode(rows):
+    """Yield each row as its own MessagePack object, for a StreamingHttpResponse.
+
+    The result is a MessagePack stream rather than one array; read it with
+    ``msgpack.Unpacker``. Only one row is encoded at a time.
+    """
+    packer = msgpack.Packer(default=_default)
+    for row in rows:
+        yield packer.pack(row)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default)
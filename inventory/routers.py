@@ -0,0 +1,56 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+class PrimaryReplicaRouter:
+    """Send reads to a replica only inside ``replica_reads()``; everything else hits ``default``."""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def set_replica_reads(enabled):
+    return _use_replica.set(enabled)
+
+
+def reset_replica_reads(token):
+    _use_replica.reset(token)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = set_replica_reads(enabled)
+    try:
+        yield
+    finally:
+        reset_replica_reads(token)
+
+
+def _pin_key(user):
+    return f'replica-pin:{user.pk}'
+
+
+def pin_to_primary(user):
+    # Keep this user's reads on the primary until replicas have caught up with the write.
+    if user.is_authenticated:
+        cache.set(_pin_key(user), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return user.is_authenticated and cache.get(_pin_key(user), False)
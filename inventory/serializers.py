@@ -1,20 +1,39 @@
+from django.conf import settings
 from rest_framework import serializers
-from inventory.models import Warehouse, Stock, Product, Order, OrderItem
+from inventory.models import Warehouse, Stock, Product, Order, OrderItem, ArchivedOrder, OutboxEvent, ReorderSuggestion
 
-class StockSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Stock
-        fields = ['id', 'warehouse', 'quantity', 'product', 'last_updated']
-        read_only_fields = ['last_updated']
+class SparseFieldsSerializerMixin:
+    """Apply the view's ``sparse_fieldset`` context (``fields``/``omit``/``expand``) to the output."""
+    expandable_fields = {}
 
-class WarehouseSerializer(serializers.ModelSerializer):
-    stocks = StockSerializer(many=True, read_only=True)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sparse = self.context.get('sparse_fieldset')
+        if not sparse:
+            return
+        selected = self.selected_fields(sparse)
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+        for name in sparse['expand']:
+            if name in self.fields and name in self.expandable_fields:
+                self.fields[name] = self.expandable_fields[name](read_only=True)
+
+    @classmethod
+    def selected_fields(cls, sparse):
+        if not sparse:
+            return list(cls.Meta.fields)
+        return [
+            name for name in cls.Meta.fields
+            if (not sparse['fields'] or name in sparse['fields']) and name not in sparse['omit']
+        ]
+
+class WarehouseSummarySerializer(serializers.ModelSerializer):
     class Meta:
         model = Warehouse
-        fields = ['id', 'name', 'location', 'manager', 'stocks']
-        read_only_fields = ['manager']
+        fields = ['id', 'name', 'location']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'sku']
@@ -24,6 +43,34 @@ class ProductSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('SKU must be alphanumeric.')
         return value
 
+class StockSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {'warehouse': WarehouseSummarySerializer, 'product': ProductSerializer}
+
+    class Meta:
+        model = Stock
+        fields = ['id', 'warehouse', 'quantity', 'product', 'last_updated', 'change_seq']
+        read_only_fields = ['last_updated', 'change_seq']
+
+class AvailabilityLineSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=50, required=False)
+    product = serializers.IntegerField(required=False)
+    warehouse = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, data):
+        if ('sku' in data) == ('product' in data):
+            raise serializers.ValidationError('Each line needs exactly one of sku or product.')
+        return data
+
+class StockAvailabilitySerializer(serializers.Serializer):
+    items = AvailabilityLineSerializer(many=True, allow_empty=False, max_length=settings.STOCK_AVAILABILITY_MAX_ITEMS)
+
+class WarehouseSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    stocks = StockSerializer(many=True, read_only=True)
+    class Meta:
+        model = Warehouse
+        fields = ['id', 'name', 'location', 'manager', 'stocks']
+        read_only_fields = ['manager']
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
@@ -35,14 +82,15 @@ class OrderItemSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Quantity must be positive.')
         return value
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, required=False)
     user = serializers.PrimaryKeyRelatedField(read_only=True, default=serializers.CurrentUserDefault())
+    expandable_fields = {'warehouse': WarehouseSummarySerializer}
 
     class Meta:
         model = Order
-        fields = ['id', 'user', 'warehouse', 'status', 'created_at', 'items']
-        read_only_fields = ['user', 'created_at']
+        fields = ['id', 'user', 'warehouse', 'status', 'created_at', 'change_seq', 'items']
+        read_only_fields = ['user', 'created_at', 'change_seq']
 
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
@@ -56,4 +104,44 @@ class OrderSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Warehouse is required for fulfilled orders')
         if not data.get('warehouse') and data.get('items', []):
             raise serializers.ValidationError('Warehouse is required when items are specified.')
-        return data
\ No newline at end of file
+        if self.instance is None and data.get('status', 'PENDING') != 'PENDING':
+            # Later statuses are only reachable through Order.TRANSITIONS.
+            raise serializers.ValidationError('New orders must start as PENDING.')
+        return data
+
+class BulkTransitionSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=settings.ORDER_BULK_TRANSITION_MAX_IDS
+    )
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+
+class ArchivedOrderSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {'warehouse': WarehouseSummarySerializer}
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'user', 'warehouse', 'status', 'created_at', 'archived_at', 'items']
+        read_only_fields = fields
+
+
+class OutboxEventSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='position')
+    type = serializers.CharField(source='event_type')
+    warehouse = serializers.IntegerField(source='warehouse_id')
+    product = serializers.IntegerField(source='product_id')
+    order = serializers.IntegerField(source='order_id')
+
+    class Meta:
+        model = OutboxEvent
+        fields = ['offset', 'type', 'warehouse', 'product', 'order', 'payload', 'created_at']
+        read_only_fields = fields
+
+
+class ReorderSuggestionSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {'warehouse': WarehouseSummarySerializer, 'product': ProductSerializer}
+
+    class Meta:
+        model = ReorderSuggestion
+        fields = ['id', 'warehouse', 'product', 'average_daily_demand', 'smoothed_daily_demand', 'on_hand',
+                  'days_of_cover', 'suggested_quantity', 'computed_at']
+        read_only_fields = fields
@@ -1,11 +1,24 @@
+from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
 from django.core.mail import send_mail
-from .models import Stock
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Stock, Order, ArchivedOrder, OutboxEvent, ReorderSuggestion
+from .forecasting import load_daily_demand, load_on_hand, forecast
+from .outbox import compact, order_event, record, stamp_change_seq
+from .routers import replica_reads
+from .serializers import OutboxEventSerializer
+
+ARCHIVABLE_STATUSES = ('FULFILLED', 'CANCELLED')
 
 @shared_task
 def send_low_stock_alert(threshold):
-    low_stock =  Stock.objects.filter(quantity__lte=threshold)
-    if low_stock.exists():
+    with replica_reads():
+        low_stock = list(Stock.objects.filter(quantity__lte=threshold).select_related('product', 'warehouse'))
+    if low_stock:
         message = "Low stock alert:\n" + "\n".join([f'{s.product.name} @ {s.warehouse.name}: {s.quantity}' for s in low_stock])
         send_mail(
             'Low Stock Alert',
@@ -13,4 +26,135 @@ def send_low_stock_alert(threshold):
             'from@example.com',
             ['admin@example.com'],
             fail_silently=False,
-        )
\ No newline at end of file
+        )
+
+def alert_on_low_stock(changes):
+    """Queue send_low_stock_alert once the write commits if any stock dropped to the threshold.
+
+    ``changes`` holds ``(quantity before, quantity after)`` pairs; call inside the
+    transaction.atomic() block that made them so rolled-back writes never alert.
+    """
+    threshold = settings.LOW_STOCK_ALERT_THRESHOLD
+    if any(before > threshold >= after for before, after in changes):
+        transaction.on_commit(lambda: send_low_stock_alert.delay(threshold))
+
+@shared_task
+def archive_old_orders(days=None):
+    """Move closed orders older than ``days`` into the ArchivedOrder cold table."""
+    if days is None:
+        days = settings.ORDER_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+    old_orders = Order.objects.filter(status__in=ARCHIVABLE_STATUSES, created_at__lt=cutoff).order_by('id')
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                old_orders.select_for_update(skip_locked=True).prefetch_related('items')[:settings.ORDER_ARCHIVE_BATCH_SIZE]
+            )
+            if not batch:
+                break
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    id=order.id,
+                    user_id=order.user_id,
+                    warehouse_id=order.warehouse_id,
+                    status=order.status,
+                    created_at=order.created_at,
+                    items=[
+                        {'product': item.product_id, 'quantity': item.quantity, 'fulfilled_quantity': item.fulfilled_quantity}
+                        for item in order.items.all()
+                    ],
+                )
+                for order in batch
+            ])
+            record(*[order_event(order, 'order.archived') for order in batch])
+            Order.objects.filter(id__in=[order.id for order in batch]).delete()
+        archived += len(batch)
+    return archived
+
+OUTBOX_RELAY_LOCK_ID = 7301
+
+def _lock_outbox_relay():
+    """Take the relay's transaction-scoped lock; False if another relay holds it."""
+    if connection.vendor != 'postgresql':
+        # Other backends used here (SQLite in development) serialize writers already.
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [OUTBOX_RELAY_LOCK_ID])
+        return cursor.fetchone()[0]
+
+@shared_task
+def relay_outbox(batch_size=None):
+    """Publish pending outbox events in commit order and give them feed offsets.
+
+    Each offset is also stamped onto the changed Stock/Order row as its change_seq.
+
+    Events are marked published in the same transaction that hands them to
+    OUTBOX_PUBLISHER, so a crash in between re-sends them (at-least-once).
+    """
+    batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+    publisher = import_string(settings.OUTBOX_PUBLISHER) if settings.OUTBOX_PUBLISHER else None
+    published = 0
+    while True:
+        with transaction.atomic():
+            # Offsets must be handed out by one relay at a time; another relay holding
+            # the lock will drain whatever is pending.
+            if not _lock_outbox_relay():
+                break
+            pending = list(OutboxEvent.objects.filter(position__isnull=True).order_by('id')[:batch_size])
+            if not pending:
+                break
+            events = compact(pending)
+            kept = {event.id for event in events}
+            OutboxEvent.objects.filter(id__in=[event.id for event in pending if event.id not in kept]).delete()
+            offset = OutboxEvent.objects.aggregate(last=Max('position'))['last'] or 0
+            for event in events:
+                offset += 1
+                event.position = offset
+            OutboxEvent.objects.bulk_update(events, ['position'])
+            stamp_change_seq(events)
+            if publisher:
+                publisher(OutboxEventSerializer(events, many=True).data)
+        published += len(events)
+    return published
+
+@shared_task
+def compute_reorder_suggestions():
+    """Forecast demand for every (warehouse, product) with recent orders and store reorder suggestions."""
+    computed_at = timezone.now()
+    days = settings.FORECAST_HISTORY_DAYS
+    with replica_reads():
+        keys, demand = load_daily_demand(timezone.localdate() - timedelta(days=days), days)
+        on_hand = load_on_hand(keys)
+    average, smoothed, days_of_cover, suggested = forecast(
+        demand, on_hand,
+        window=settings.FORECAST_WINDOW_DAYS,
+        alpha=settings.FORECAST_SMOOTHING,
+        cover_days=settings.REORDER_LEAD_TIME_DAYS + settings.REORDER_REVIEW_DAYS,
+    )
+    suggestions = [
+        ReorderSuggestion(
+            warehouse_id=warehouse_id,
+            product_id=product_id,
+            average_daily_demand=average_demand,
+            smoothed_daily_demand=smoothed_demand,
+            on_hand=stock,
+            days_of_cover=None if cover == float('inf') else cover,
+            suggested_quantity=quantity,
+            computed_at=computed_at,
+        )
+        for (warehouse_id, product_id), average_demand, smoothed_demand, stock, cover, quantity in zip(
+            keys.tolist(), average.tolist(), smoothed.tolist(), on_hand.tolist(), days_of_cover.tolist(), suggested.tolist()
+        )
+    ]
+    with transaction.atomic():
+        ReorderSuggestion.objects.bulk_create(
+            suggestions,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['warehouse', 'product'],
+            update_fields=['average_daily_demand', 'smoothed_daily_demand', 'on_hand', 'days_of_cover',
+                           'suggested_quantity', 'computed_at'],
+        )
+        ReorderSuggestion.objects.filter(computed_at__lt=computed_at).delete()
+    return len(suggestions)
@@ -1,11 +1,27 @@
+import io
 import jwt
+import msgpack
+from datetime import timedelta
+from unittest import skipUnless
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core import mail
+from django.db import connections
+from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APIClient
-from .models import Warehouse, Product, Stock, Order, OrderItem
+from .models import Warehouse, Product, Stock, Order, OrderItem, ArchivedOrder, OutboxEvent
+from .tasks import archive_old_orders, relay_outbox, compute_reorder_suggestions
+from .routers import PrimaryReplicaRouter, replica_reads, is_pinned_to_primary
 
 
+# Replica routing is covered by ReplicaRoutingTestCase; TestCase's wrapping transaction
+# is invisible to replica connections.
+@override_settings(DATABASE_REPLICAS=[])
 class InventoryAPITestCase(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -228,3 +244,479 @@ class InventoryAPITestCase(TestCase):
                 'items': [{'product': self.product.id, 'quantity': 40}]}
         response = create_order(data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_archive_old_orders(self):
+        old = timezone.now() - timedelta(days=400)
+        fulfilled = Order.objects.create(user=self.user, warehouse=self.warehouse, status='FULFILLED')
+        OrderItem.objects.create(order=fulfilled, product=self.product, quantity=2, fulfilled_quantity=2)
+        Order.objects.filter(id__in=[fulfilled.id, self.order.id]).update(created_at=old)
+
+        self.assertEqual(archive_old_orders(365), 1)
+        self.assertFalse(Order.objects.filter(id=fulfilled.id).exists())
+        self.assertTrue(Order.objects.filter(id=self.order.id).exists())
+        archived = ArchivedOrder.objects.get(id=fulfilled.id)
+        self.assertEqual(archived.items, [{'product': self.product.id, 'quantity': 2, 'fulfilled_quantity': 2}])
+
+        response = self.client.get('/api/archived-orders/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([o['id'] for o in response.data['results']], [fulfilled.id])
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_replica_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Stock), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Stock), 'replica1')
+            self.assertEqual(router.db_for_write(Stock), 'default')
+        self.assertEqual(router.db_for_read(Stock), 'default')
+
+    def test_write_pins_user_to_primary(self):
+        cache.clear()
+        response = self.client.get('/api/stocks/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(is_pinned_to_primary(self.user))
+        response = self.client.patch(f'/api/stocks/{self.stock.id}/', {'quantity': 60}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(is_pinned_to_primary(self.user))
+
+    def test_order_create_writes_outbox_events(self):
+        data = {
+            'warehouse': self.warehouse.id,
+            'status': 'PENDING',
+            'items': [{'product': self.product.id, 'quantity': 3}]
+        }
+        response = self.client.post('/api/orders/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        events = OutboxEvent.objects.filter(position__isnull=True)
+        self.assertEqual([e.event_type for e in events], ['order.created', 'stock.changed'])
+        self.assertEqual(events[1].payload, {'quantity': 47})
+
+    def test_failed_order_writes_no_outbox_events(self):
+        data = {
+            'warehouse': self.warehouse.id,
+            'status': 'PENDING',
+            'items': [{'product': self.product.id, 'quantity': 60}]
+        }
+        response = self.client.post('/api/orders/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_relay_compacts_stock_events_into_feed(self):
+        cache.clear()
+        for quantity in (40, 30, 20):
+            self.client.patch(f'/api/stocks/{self.stock.id}/', {'quantity': quantity}, format='json')
+        self.client.patch(f'/api/stocks/{self.stock2.id}/', {'quantity': 5}, format='json')
+        self.assertEqual(relay_outbox(), 2)
+        self.assertEqual(relay_outbox(), 0)
+
+        response = self.client.get('/api/events/?offset=0', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        events = response.data['events']
+        self.assertEqual([(e['offset'], e['product'], e['payload']['quantity']) for e in events],
+                         [(1, self.product.id, 20), (2, self.product2.id, 5)])
+        self.assertEqual(response.data['next_offset'], 2)
+        response = self.client.get('/api/events/?offset=2', format='json')
+        self.assertEqual(response.data['events'], [])
+
+    def test_event_feed_hides_other_users_orders(self):
+        other = User.objects.create_user(username='other', password='testpass')
+        other_client = APIClient()
+        other_client.force_authenticate(other)
+        data = {
+            'warehouse': self.warehouse.id,
+            'status': 'PENDING',
+            'items': [{'product': self.product.id, 'quantity': 3}]
+        }
+        other_order = other_client.post('/api/orders/', data, format='json').data['id']
+        own_order = self.client.post('/api/orders/', data, format='json').data['id']
+        relay_outbox()
+
+        events = self.client.get('/api/events/', format='json').data['events']
+        self.assertEqual([e['order'] for e in events if e['type'] == 'order.created'], [own_order])
+        self.assertTrue([e for e in events if e['type'] == 'stock.changed'])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.admin_token)
+        events = self.client.get('/api/events/', format='json').data['events']
+        self.assertEqual([e['order'] for e in events if e['type'] == 'order.created'], [other_order, own_order])
+
+    def test_stock_changes_since_watermark(self):
+        cache.clear()
+        self.client.patch(f'/api/stocks/{self.stock.id}/', {'quantity': 40}, format='json')
+        relay_outbox()
+        response = self.client.get('/api/stocks/changes/?since=0', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in response.data['changed']], [self.stock.id])
+        since = response.data['next_since']
+
+        self.client.patch(f'/api/stocks/{self.stock2.id}/', {'quantity': 8}, format='json')
+        self.client.delete(f'/api/stocks/{self.stock.id}/')
+        response = self.client.get(f'/api/stocks/changes/?since={since}', format='json')
+        self.assertEqual(response.data['changed'], [])
+        relay_outbox()
+        response = self.client.get(f'/api/stocks/changes/?since={since}', format='json')
+        self.assertEqual([(row['id'], row['quantity']) for row in response.data['changed']], [(self.stock2.id, 8)])
+        self.assertEqual(response.data['deleted'], [
+            {'seq': response.data['next_since'], 'warehouse': self.warehouse.id, 'product': self.product.id}
+        ])
+
+    def test_full_sync_from_zero_includes_existing_rows(self):
+        # setUpTestData rows were written straight through the ORM, bypassing the outbox.
+        response = self.client.get('/api/stocks/changes/?since=0', format='json')
+        self.assertEqual(response.data['changed'], [])
+        call_command('enqueue_changes', '--unstamped', stdout=io.StringIO())
+        relay_outbox()
+        response = self.client.get('/api/stocks/changes/?since=0&limit=1', format='json')
+        self.assertEqual([row['id'] for row in response.data['changed']], [self.stock.id])
+        response = self.client.get(f'/api/stocks/changes/?since={response.data["next_since"]}', format='json')
+        self.assertEqual([row['id'] for row in response.data['changed']], [self.stock2.id])
+        response = self.client.get(f'/api/orders/changes/?since=0', format='json')
+        self.assertEqual([row['id'] for row in response.data['changed']], [self.order.id])
+
+    def test_order_changes_include_archived_tombstones(self):
+        data = {
+            'warehouse': self.warehouse.id,
+            'status': 'PENDING',
+            'items': [{'product': self.product.id, 'quantity': 3}]
+        }
+        order_id = self.client.post('/api/orders/', data, format='json').data['id']
+        Order.objects.filter(id=order_id).update(status='CANCELLED', created_at=timezone.now() - timedelta(days=400))
+        relay_outbox()
+        response = self.client.get('/api/orders/changes/', format='json')
+        self.assertEqual([row['id'] for row in response.data['changed']], [order_id])
+        self.assertEqual(response.data['deleted'], [])
+
+        archive_old_orders(365)
+        relay_outbox()
+        response = self.client.get(f'/api/orders/changes/?since={response.data["next_since"]}', format='json')
+        self.assertEqual(response.data['changed'], [])
+        self.assertEqual([(row['id'], row['reason']) for row in response.data['deleted']], [(order_id, 'archived')])
+
+    def test_order_stock_decrement_touches_last_updated(self):
+        before = self.stock.last_updated
+        data = {
+            'warehouse': self.warehouse.id,
+            'status': 'PENDING',
+            'items': [{'product': self.product.id, 'quantity': 1}]
+        }
+        self.client.post('/api/orders/', data, format='json')
+        self.stock.refresh_from_db()
+        self.assertGreater(self.stock.last_updated, before)
+
+    def test_sparse_fields_prune_columns(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get('/api/products/?fields=id,sku', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {'id': self.product.id, 'sku': 'LT123'})
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+
+    def test_unknown_sparse_fields_rejected(self):
+        response = self.client.get('/api/products/?fields=id,bogus', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('bogus', str(response.data['fields']))
+        response = self.client.get('/api/products/?expand=sku', format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', response.data)
+
+    def test_omit_nested_items_skips_prefetch(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.admin_token)
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get('/api/orders/?omit=items', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('items', response.data['results'][0])
+        self.assertFalse([q for q in queries.captured_queries if 'inventory_orderitem' in q['sql']])
+
+        response = self.client.get('/api/orders/', format='json')
+        self.assertEqual(response.data['results'][0]['items'][0]['quantity'], 5)
+
+    def test_expand_stock_relations(self):
+        response = self.client.get(f'/api/stocks/{self.stock.id}/?fields=id,quantity,product&expand=product', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['quantity'], 50)
+        self.assertEqual(response.data['product']['sku'], 'LT123')
+        self.assertNotIn('warehouse', response.data)
+
+    def test_stock_availability_multi_get(self):
+        warehouse2 = Warehouse.objects.create(name='WH2', location='Beijing')
+        Stock.objects.create(warehouse=warehouse2, product=self.product, quantity=7)
+        data = {'items': [
+            {'sku': 'LT123', 'warehouse': self.warehouse.id},
+            {'product': self.product2.id},
+            {'sku': 'MISSING1'},
+        ]}
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.post('/api/stocks/availability/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([q for q in queries.captured_queries if 'inventory_product' in q['sql']]), 1)
+        availability = response.data['availability']
+        self.assertEqual(availability['skus']['LT123'], {
+            'product': self.product.id, 'sku': 'LT123', 'total': 57, 'warehouses': {str(self.warehouse.id): 50},
+        })
+        self.assertEqual(availability['products'][str(self.product2.id)]['total'], 0)
+        self.assertIsNone(availability['skus']['MISSING1'])
+
+    def test_stock_availability_numeric_sku_does_not_collide_with_product_id(self):
+        numeric = Product.objects.create(name='Numeric', sku='123')
+        Stock.objects.create(warehouse=self.warehouse, product=numeric, quantity=9)
+        data = {'items': [{'sku': '123'}, {'product': 123}]}
+        response = self.client.post('/api/stocks/availability/', data, format='json')
+        self.assertEqual(response.data['availability']['skus']['123']['total'], 9)
+        self.assertIsNone(response.data['availability']['products']['123'])
+
+    def test_stock_availability_rejects_ambiguous_line(self):
+        data = {'items': [{'sku': 'LT123', 'product': self.product.id}]}
+        response = self.client.post('/api/stocks/availability/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(STOCK_AVAILABILITY_CACHE_SECONDS=60)
+    def test_stock_availability_served_from_cache(self):
+        cache.clear()
+        data = {'items': [{'sku': 'LT123'}]}
+        self.client.post('/api/stocks/availability/', data, format='json')
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.post('/api/stocks/availability/', data, format='json')
+        self.assertEqual(response.data['availability']['skus']['LT123']['total'], 50)
+        self.assertFalse([q for q in queries.captured_queries if 'inventory_product' in q['sql']])
+
+    def test_msgpack_list_response(self):
+        response = self.client.get('/api/stocks/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['results'][0]['quantity'], 50)
+
+    def test_msgpack_request_body(self):
+        body = msgpack.packb({
+            'warehouse': self.warehouse.id,
+            'status': 'PENDING',
+            'items': [{'product': self.product.id, 'quantity': 3}],
+        })
+        response = self.client.post('/api/orders/', body, content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(msgpack.unpackb(response.content)['status'], 'PENDING')
+
+    def test_export_orders_streams_msgpack(self):
+        response = self.client.get('/api/orders/export_orders/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(b''.join(response.streaming_content))
+        rows = list(unpacker)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], self.order.id)
+        self.assertEqual(rows[0]['total_items'], 5)
+
+    def test_malformed_msgpack_rejected(self):
+        response = self.client.post('/api/products/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(FORECAST_HISTORY_DAYS=4, FORECAST_WINDOW_DAYS=2, FORECAST_SMOOTHING=0.5,
+                       REORDER_LEAD_TIME_DAYS=1, REORDER_REVIEW_DAYS=1)
+    def test_reorder_suggestions(self):
+        noon = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        for days_ago in (1, 2, 3):
+            order = Order.objects.create(user=self.user, warehouse=self.warehouse, status='FULFILLED')
+            OrderItem.objects.create(order=order, product=self.product2, quantity=10)
+            Order.objects.filter(id=order.id).update(created_at=noon - timedelta(days=days_ago))
+        cancelled = Order.objects.create(user=self.user, warehouse=self.warehouse, status='CANCELLED')
+        OrderItem.objects.create(order=cancelled, product=self.product2, quantity=100)
+        Order.objects.filter(id=cancelled.id).update(created_at=noon - timedelta(days=1))
+
+        self.assertEqual(compute_reorder_suggestions(), 1)
+        response = self.client.get(f'/api/reorder-suggestions/?product={self.product2.id}', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        suggestion = response.data['results'][0]
+        # Daily demand [0, 10, 10, 10]: smoothed 0.5*(10*0.25 + 10*0.5 + 10) = 8.75, cover 2 days, 0 on hand.
+        self.assertEqual(suggestion['average_daily_demand'], 10)
+        self.assertAlmostEqual(suggestion['smoothed_daily_demand'], 8.75)
+        self.assertEqual(suggestion['days_of_cover'], 0)
+        self.assertEqual(suggestion['suggested_quantity'], 18)
+
+    def create_order(self, quantity, product=None):
+        data = {
+            'warehouse': self.warehouse.id,
+            'status': 'PENDING',
+            'items': [{'product': (product or self.product).id, 'quantity': quantity}]
+        }
+        response = self.client.post('/api/orders/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def test_bulk_cancel_releases_stock(self):
+        first, second = self.create_order(10), self.create_order(5)
+        cancelled = Order.objects.create(user=self.user, warehouse=self.warehouse, status='CANCELLED')
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 35)
+
+        data = {'ids': [first, second, cancelled.id, 99999], 'status': 'CANCELLED'}
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.post('/api/orders/bulk_transition/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['transitioned'], 2)
+        self.assertEqual(response.data['results'], {
+            str(first): 'transitioned', str(second): 'transitioned',
+            str(cancelled.id): 'invalid_transition', '99999': 'not_found',
+        })
+        stock_updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "inventory_stock"')]
+        self.assertEqual(len(stock_updates), 1)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 50)
+        self.assertEqual(Order.objects.filter(id__in=[first, second], status='CANCELLED').count(), 2)
+
+    def test_bulk_fulfil_follows_state_machine(self):
+        pending = self.create_order(10)
+        processing = [self.create_order(20), self.create_order(15)]
+        data = {'ids': processing, 'status': 'PROCESSING'}
+        self.assertEqual(self.client.post('/api/orders/bulk_transition/', data, format='json').data['transitioned'], 2)
+
+        data = {'ids': [pending] + processing, 'status': 'FULFILLED'}
+        response = self.client.post('/api/orders/bulk_transition/', data, format='json')
+        self.assertEqual(response.data['results'], {
+            str(pending): 'invalid_transition',
+            str(processing[0]): 'transitioned',
+            str(processing[1]): 'transitioned',
+        })
+        self.assertEqual(OrderItem.objects.get(order_id=processing[0]).fulfilled_quantity, 20)
+        self.assertEqual(Order.objects.get(id=pending).status, 'PENDING')
+
+    def test_fulfilment_does_not_take_reserved_stock_again(self):
+        order_id = self.create_order(10)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 40)
+        for target in ('PROCESSING', 'FULFILLED'):
+            data = {'ids': [order_id], 'status': target}
+            self.assertEqual(self.client.post('/api/orders/bulk_transition/', data, format='json').data['transitioned'], 1)
+            self.stock.refresh_from_db()
+            self.assertEqual(self.stock.quantity, 40)
+
+    def test_bulk_transition_only_touches_own_orders(self):
+        other = User.objects.create_user(username='other', password='testpass')
+        foreign = Order.objects.create(user=other, warehouse=self.warehouse, status='PENDING')
+        data = {'ids': [foreign.id], 'status': 'CANCELLED'}
+        response = self.client.post('/api/orders/bulk_transition/', data, format='json')
+        self.assertEqual(response.data['results'], {str(foreign.id): 'not_found'})
+
+    def test_cancel_single_order_releases_stock(self):
+        order_id = self.create_order(10)
+        response = self.client.patch(f'/api/orders/{order_id}/', {'status': 'CANCELLED'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 50)
+
+    def test_patch_status_follows_state_machine(self):
+        order_id = self.create_order(10)
+        self.assertEqual(self.client.patch(f'/api/orders/{order_id}/', {'status': 'CANCELLED'}, format='json').status_code,
+                         status.HTTP_200_OK)
+        response = self.client.patch(f'/api/orders/{order_id}/', {'status': 'PENDING'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Cannot change order status from CANCELLED to PENDING', str(response.data))
+        response = self.client.patch(f'/api/orders/{order_id}/', {'status': 'CANCELLED'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 50)
+        self.assertEqual(Order.objects.get(id=order_id).status, 'CANCELLED')
+
+    def test_patch_fulfil_keeps_reserved_stock(self):
+        order_id = self.create_order(10)
+        self.client.patch(f'/api/orders/{order_id}/', {'status': 'PROCESSING'}, format='json')
+        response = self.client.patch(f'/api/orders/{order_id}/', {'status': 'FULFILLED', 'warehouse': self.warehouse.id},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 40)
+        self.assertEqual(OrderItem.objects.get(order_id=order_id).fulfilled_quantity, 10)
+
+    def test_patch_cannot_skip_processing(self):
+        order_id = self.create_order(10)
+        response = self.client.patch(f'/api/orders/{order_id}/', {'status': 'FULFILLED', 'warehouse': self.warehouse.id},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.get(id=order_id).status, 'PENDING')
+
+    def test_patch_cannot_move_order_with_items(self):
+        order_id = self.create_order(10)
+        other = Warehouse.objects.create(name='WH2', location='Beijing', manager=self.user)
+        for data in ({'warehouse': other.id}, {'warehouse': other.id, 'status': 'CANCELLED'}):
+            response = self.client.patch(f'/api/orders/{order_id}/', data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.get(id=order_id).warehouse, self.warehouse)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 40)
+
+    def test_cancel_without_stock_row_is_reported(self):
+        order_id = self.create_order(10)
+        self.stock.delete()
+        response = self.client.post('/api/orders/bulk_transition/', {'ids': [order_id], 'status': 'CANCELLED'}, format='json')
+        self.assertEqual(response.data['results'], {str(order_id): 'missing_stock'})
+        response = self.client.patch(f'/api/orders/{order_id}/', {'status': 'CANCELLED'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.get(id=order_id).status, 'PENDING')
+
+    def test_new_orders_start_pending(self):
+        for order_status in ('PROCESSING', 'FULFILLED', 'CANCELLED'):
+            data = {'warehouse': self.warehouse.id, 'status': order_status,
+                    'items': [{'product': self.product.id, 'quantity': 10}]}
+            response = self.client.post('/api/orders/', data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('New orders must start as PENDING', str(response.data))
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 50)
+
+    def test_changes_rejects_negative_paging(self):
+        for url in ('/api/stocks/changes/?limit=-1', '/api/orders/changes/?limit=0', '/api/stocks/changes/?since=-5'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_event_feed_rejects_negative_paging(self):
+        for url in ('/api/events/?limit=-1', '/api/events/?offset=-1', '/api/events/?limit=abc'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_low_stock_alert_queued_when_write_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_order(10)
+        self.assertEqual(len(mail.outbox), 0)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.create_order(35)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Laptop @ WH1: 5', mail.outbox[0].body)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.patch(f'/api/stocks/{self.stock.id}/', {'quantity': 3}, format='json')
+        self.assertEqual(len(callbacks), 0)
+
+    def test_warehouse_delete_events_show_orders_without_warehouse(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.admin_token}')
+        response = self.client.delete(f'/api/warehouses/{self.warehouse.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        event = OutboxEvent.objects.get(event_type='order.updated', order_id=self.order.id)
+        self.assertIsNone(event.warehouse_id)
+        self.assertIsNone(event.payload['warehouse'])
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'no read replica configured (set DB_REPLICA_HOSTS)')
+class ReplicaRoutingTestCase(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='replicauser', password='testpass')
+        warehouse = Warehouse.objects.create(name='WH1', location='Shanghai', manager=self.user)
+        product = Product.objects.create(name='Laptop', sku='LT123')
+        self.stock = Stock.objects.create(warehouse=warehouse, product=product, quantity=50)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reads_use_replica_until_user_writes(self):
+        replica = settings.DATABASE_REPLICAS[0]
+        with CaptureQueriesContext(connections[replica]) as replica_queries:
+            response = self.client.get('/api/stocks/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['quantity'], 50)
+        self.assertTrue(replica_queries.captured_queries)
+
+        self.client.patch(f'/api/stocks/{self.stock.id}/', {'quantity': 60}, format='json')
+        with CaptureQueriesContext(connections[replica]) as replica_queries:
+            response = self.client.get('/api/stocks/', format='json')
+        self.assertEqual(response.data['results'][0]['quantity'], 60)
+        self.assertFalse(replica_queries.captured_queries)
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Order, OrderItem, Stock
+from .outbox import record, stock_event, order_event
+
+TRANSITIONED = 'transitioned'
+NOT_FOUND = 'not_found'
+INVALID_TRANSITION = 'invalid_transition'
+NO_WAREHOUSE = 'no_warehouse'
+MISSING_STOCK = 'missing_stock'
+
+
+def _open_quantities(orders):
+    """``{order id: {product id: units not yet fulfilled}}`` from one OrderItem query."""
+    quantities = defaultdict(lambda: defaultdict(int))
+    rows = OrderItem.objects.filter(order__in=[order.id for order in orders]).values_list(
+        'order_id', 'product_id', 'quantity', 'fulfilled_quantity'
+    )
+    for order_id, product_id, quantity, fulfilled in rows:
+        quantities[order_id][product_id] += quantity - fulfilled
+    return quantities
+
+
+def _apply_stock_deltas(deltas):
+    """One UPDATE per (warehouse, product); returns the changed stocks for the outbox.
+
+    Raises Stock.DoesNotExist rather than dropping units when a key has no stock row.
+    """
+    now = timezone.now()
+    keys = {key for key, delta in deltas.items() if delta}
+    for warehouse_id, product_id in keys:
+        updated = Stock.objects.filter(warehouse_id=warehouse_id, product_id=product_id).update(
+            quantity=F('quantity') + deltas[(warehouse_id, product_id)], last_updated=now
+        )
+        if not updated:
+            raise Stock.DoesNotExist(f'No stock row for warehouse {warehouse_id}, product {product_id}.')
+    if not keys:
+        return []
+    stocks = Stock.objects.filter(
+        warehouse_id__in={key[0] for key in keys}, product_id__in={key[1] for key in keys}
+    )
+    return [stock for stock in stocks if (stock.warehouse_id, stock.product_id) in keys]
+
+
+def release_stock(orders):
+    """Return the open quantities of ``orders`` to stock. Call inside transaction.atomic().
+
+    Orders whose warehouse has lost a stock row they reserved from are left out.
+    Returns ``(changed stocks, ids of the orders left out)``.
+    """
+    quantities = _open_quantities(orders)
+    needed = {
+        order.id: {(order.warehouse_id, product_id) for product_id, quantity in quantities[order.id].items() if quantity}
+        for order in orders if order.warehouse_id is not None
+    }
+    keys = set().union(*needed.values())
+    existing = set()
+    if keys:
+        # Locked so the rows cannot be deleted between this check and the UPDATEs.
+        existing = set(
+            Stock.objects.select_for_update().filter(
+                warehouse_id__in={key[0] for key in keys}, product_id__in={key[1] for key in keys}
+            ).order_by('id').values_list('warehouse_id', 'product_id')
+        )
+    missing = {order_id for order_id, order_keys in needed.items() if not order_keys <= existing}
+    deltas = defaultdict(int)
+    for order in orders:
+        if order.id not in needed or order.id in missing:
+            continue
+        for product_id, quantity in quantities[order.id].items():
+            deltas[(order.warehouse_id, product_id)] += quantity
+    return _apply_stock_deltas(deltas), missing
+
+
+def transition_locked(orders, status, outcomes):
+    """Move already locked ``orders`` to ``status`` following Order.TRANSITIONS.
+
+    Call inside transaction.atomic() with the orders fetched ``select_for_update()``.
+    Fills ``outcomes`` and returns ``(moved orders, changed stocks)``; the caller
+    records the outbox events.
+    """
+    movable = []
+    for order in orders:
+        if status not in Order.TRANSITIONS[order.status]:
+            outcomes[order.id] = INVALID_TRANSITION
+        elif status == 'FULFILLED' and order.warehouse_id is None:
+            outcomes[order.id] = NO_WAREHOUSE
+        else:
+            movable.append(order)
+
+    changed_stocks = []
+    if status == 'CANCELLED':
+        changed_stocks, missing = release_stock(movable)
+        for order in movable:
+            if order.id in missing:
+                outcomes[order.id] = MISSING_STOCK
+        movable = [order for order in movable if order.id not in missing]
+    elif status == 'FULFILLED':
+        # Stock was reserved when the order was created; fulfilment only records it.
+        OrderItem.objects.filter(order__in=[order.id for order in movable]).update(
+            fulfilled_quantity=F('quantity')
+        )
+    Order.objects.filter(id__in=[order.id for order in movable]).update(status=status)
+    for order in movable:
+        order.status = status
+        outcomes[order.id] = TRANSITIONED
+    return movable, changed_stocks
+
+
+def bulk_transition(queryset, order_ids, status):
+    """Move the orders in ``order_ids`` (restricted to ``queryset``) to ``status``.
+
+    Work is done in chunks of ORDER_BULK_TRANSITION_CHUNK_SIZE, each in its own
+    transaction. Returns ``{order id: outcome}``.
+    """
+    outcomes = {}
+    order_ids = sorted(set(order_ids))
+    chunk_size = settings.ORDER_BULK_TRANSITION_CHUNK_SIZE
+    for start in range(0, len(order_ids), chunk_size):
+        chunk = order_ids[start:start + chunk_size]
+        with transaction.atomic():
+            orders = list(
+                queryset.filter(id__in=chunk).select_for_update().order_by('id')
+                .only('id', 'status', 'warehouse_id', 'user_id')
+            )
+            found = {order.id for order in orders}
+            outcomes.update({order_id: NOT_FOUND for order_id in chunk if order_id not in found})
+            moved, changed_stocks = transition_locked(orders, status, outcomes)
+            record(*[order_event(order, 'order.updated') for order in moved],
+                   *[stock_event(stock) for stock in changed_stocks])
+    return outcomes
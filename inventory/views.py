@@ -1,16 +1,149 @@
 from rest_framework import viewsets, serializers
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.decorators import action
-from django.http import HttpResponse
-from django.db.models import Sum, F
-from django.db import transaction
+from django.core.exceptions import FieldDoesNotExist
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db.models import Sum, F, Q
+from django.db import router, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 import csv
-from .models import Warehouse, Product, Stock, Order, OrderItem
-from .serializers import WarehouseSerializer, ProductSerializer, StockSerializer, OrderSerializer
-from .tasks import send_low_stock_alert
+from collections import defaultdict
+from .models import Warehouse, Product, Stock, Order, OrderItem, ArchivedOrder, OutboxEvent, ReorderSuggestion
+from .serializers import WarehouseSerializer, ProductSerializer, StockSerializer, OrderSerializer, ArchivedOrderSerializer, OutboxEventSerializer, StockAvailabilitySerializer, ReorderSuggestionSerializer, BulkTransitionSerializer
+from .availability import availability
+from .transitions import bulk_transition, transition_locked, TRANSITIONED, NO_WAREHOUSE, MISSING_STOCK
+from .tasks import send_low_stock_alert, alert_on_low_stock
+from .outbox import record, stock_event, order_event, DELETION_EVENTS
+from .renderers import iter_encode
+from .routers import set_replica_reads, reset_replica_reads, pin_to_primary, is_pinned_to_primary
 
-class WarehouseViewSet(viewsets.ModelViewSet):
+class ReplicaReadMixin:
+    """Serve ``replica_actions`` from a read replica unless the user wrote recently."""
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        use_replica = self.action in self.replica_actions and not is_pinned_to_primary(request.user)
+        self._replica_token = set_replica_reads(use_replica)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            reset_replica_reads(token)
+            self._replica_token = None
+        if request.method not in SAFE_METHODS and self.action not in self.replica_actions and response.status_code < 400:
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+class SparseQuerysetMixin:
+    """``?fields=``, ``?omit=`` and ``?expand=`` on reads, pruned down to the SQL.
+
+    Unselected columns are deferred with ``.only()``, reverse relations are only
+    prefetched when their field is returned, and expanded foreign keys are joined.
+    """
+
+    def get_sparse_fieldset(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+        params = self.request.query_params
+        if not any(key in params for key in ('fields', 'omit', 'expand')):
+            return None
+
+        def names(key):
+            return {name.strip() for name in params.get(key, '').split(',') if name.strip()}
+        sparse = {'fields': names('fields'), 'omit': names('omit'), 'expand': names('expand')}
+
+        serializer_class = self.get_serializer_class()
+        known = {'fields': set(serializer_class.Meta.fields), 'omit': set(serializer_class.Meta.fields),
+                 'expand': set(serializer_class.expandable_fields)}
+        errors = {
+            key: f'Unknown field(s): {", ".join(sorted(sparse[key] - known[key]))}.'
+            for key in sparse if sparse[key] - known[key]
+        }
+        if errors:
+            raise serializers.ValidationError(errors)
+        return sparse
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sparse_fieldset'] = self.get_sparse_fieldset()
+        return context
+
+    def filter_queryset(self, queryset):
+        return self.prune_queryset(super().filter_queryset(queryset))
+
+    def prune_queryset(self, queryset):
+        serializer_class = self.get_serializer_class()
+        sparse = self.get_sparse_fieldset()
+        expand = sparse['expand'] if sparse else set()
+        columns, prefetch, joins = [], [], []
+        for name in serializer_class.selected_fields(sparse):
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.one_to_many or field.many_to_many:
+                prefetch.append(name)
+            elif field.many_to_one and name in expand and name in serializer_class.expandable_fields:
+                joins.append(name)
+                columns.append(name)
+                columns.extend(f'{name}__{related}' for related in serializer_class.expandable_fields[name].Meta.fields)
+            else:
+                columns.append(name)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if joins:
+            queryset = queryset.select_related(*joins)
+        if sparse and (sparse['fields'] or sparse['omit']):
+            queryset = queryset.only(*columns)
+        return queryset
+
+def _paging_params(request, cursor, max_limit):
+    """``(cursor, limit)`` from the query string, with ``limit`` capped at ``max_limit``."""
+    try:
+        position = int(request.query_params.get(cursor, 0))
+        limit = int(request.query_params.get('limit', 100))
+    except ValueError:
+        raise serializers.ValidationError(f'{cursor} and limit must be integers.')
+    if position < 0 or limit < 1:
+        raise serializers.ValidationError(f'{cursor} must be at least 0 and limit at least 1.')
+    return position, min(limit, max_limit)
+
+class ChangesMixin:
+    """``changes`` action: rows relayed after ``?since=<seq>`` plus tombstones for deleted rows.
+
+    Pass the returned ``next_since`` back on the next call. List filters apply to both.
+    A full initial sync is ``since=0`` paged until ``changed`` and ``deleted`` come back
+    empty: every row carries a change_seq once relayed, so that walks the whole table and
+    leaves the client holding the watermark for incremental calls.
+    """
+    max_changes = 1000
+
+    def get_tombstones(self):
+        raise NotImplementedError
+
+    def tombstone_data(self, event):
+        raise NotImplementedError
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        since, limit = _paging_params(request, 'since', self.max_changes)
+        rows = list(self.filter_queryset(self.get_queryset()).filter(change_seq__gt=since).order_by('change_seq')[:limit])
+        tombstones = list(self.get_tombstones().filter(position__gt=since).order_by('position')[:limit])
+        # Cut the merged stream at ``limit`` so next_since never skips an unsent change.
+        seqs = sorted([row.change_seq for row in rows] + [event.position for event in tombstones])[:limit]
+        next_since = seqs[-1] if seqs else since
+        rows = [row for row in rows if row.change_seq <= next_since]
+        tombstones = [event for event in tombstones if event.position <= next_since]
+        return Response({
+            'next_since': next_since,
+            'changed': self.get_serializer(rows, many=True).data,
+            'deleted': [self.tombstone_data(event) for event in tombstones],
+        })
+
+class WarehouseViewSet(ReplicaReadMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = WarehouseSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ['name', 'location']
@@ -26,17 +159,73 @@ class WarehouseViewSet(viewsets.ModelViewSet):
         else:
             serializer.save(manager=self.request.user)
 
-class ProductViewSet(viewsets.ModelViewSet):
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Stocks cascade away and orders lose their warehouse; describe them as they are afterwards.
+            orders = list(instance.orders.all())
+            for order in orders:
+                order.warehouse_id = None
+            record(
+                *[stock_event(stock, 'stock.deleted') for stock in instance.stocks.all()],
+                *[order_event(order, 'order.updated') for order in orders],
+            )
+            instance.delete()
+
+class ProductViewSet(ReplicaReadMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ['name', 'sku']
 
-class StockViewSet(viewsets.ModelViewSet):
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Stocks and order lines for the product cascade away.
+            record(
+                *[stock_event(stock, 'stock.deleted') for stock in instance.stocks.all()],
+                *[order_event(order, 'order.updated') for order in Order.objects.filter(items__product=instance).distinct()],
+            )
+            instance.delete()
+
+class StockViewSet(ReplicaReadMixin, SparseQuerysetMixin, ChangesMixin, viewsets.ModelViewSet):
     queryset = Stock.objects.all()
     serializer_class = StockSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ['warehouse', 'product']
+    replica_actions = ('list', 'retrieve', 'low_stock', 'changes', 'availability')
+
+    def get_tombstones(self):
+        tombstones = OutboxEvent.objects.filter(event_type='stock.deleted')
+        for name in self.filterset_fields:
+            if self.request.query_params.get(name):
+                tombstones = tombstones.filter(**{f'{name}_id': self.request.query_params[name]})
+        return tombstones
+
+    def tombstone_data(self, event):
+        return {'seq': event.position, 'warehouse': event.warehouse_id, 'product': event.product_id}
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            stock = serializer.save()
+            record(stock_event(stock))
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            before = serializer.instance.quantity
+            stock = serializer.save()
+            record(stock_event(stock))
+            alert_on_low_stock([(before, stock.quantity)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            record(stock_event(instance, 'stock.deleted'))
+            instance.delete()
+
+    @action(detail=False, methods=['post'])
+    def availability(self, request):
+        """Availability for many ``{sku|product, warehouse?}`` lines in one call."""
+        serializer = StockAvailabilitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'availability': availability(serializer.validated_data['items'])})
 
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
@@ -47,16 +236,28 @@ class StockViewSet(viewsets.ModelViewSet):
             send_low_stock_alert.delay(threshold)
         return Response(serializer.data)
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ReplicaReadMixin, SparseQuerysetMixin, ChangesMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ['status', 'warehouse']
+    replica_actions = ('list', 'retrieve', 'export_orders', 'changes')
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return Order.objects.all()
         return Order.objects.filter(user=self.request.user)
 
+    def get_tombstones(self):
+        tombstones = OutboxEvent.objects.filter(event_type__in=DELETION_EVENTS, order_id__isnull=False)
+        if self.request.query_params.get('warehouse'):
+            tombstones = tombstones.filter(warehouse_id=self.request.query_params['warehouse'])
+        if self.request.user.is_staff:
+            return tombstones
+        return tombstones.filter(payload__user=self.request.user.id)
+
+    def tombstone_data(self, event):
+        return {'seq': event.position, 'id': event.order_id, 'reason': event.event_type.split('.')[1]}
+
     def perform_create(self, serializer):
         with transaction.atomic():
             validated_data = serializer.validated_data
@@ -80,33 +281,137 @@ class OrderViewSet(viewsets.ModelViewSet):
             for item_data in items_data:
                 OrderItem.objects.create(order=order, **item_data)
                 Stock.objects.filter(warehouse=warehouse, product=item_data['product']).update(
-                    quantity=F('quantity') - item_data['quantity']
+                    quantity=F('quantity') - item_data['quantity'], last_updated=timezone.now()
                 )
+            changed = Stock.objects.filter(warehouse=warehouse, product__in=[item['product'] for item in items_data])
+            record(order_event(order, 'order.created'), *[stock_event(stock) for stock in changed])
+            taken = defaultdict(int)
+            for item_data in items_data:
+                taken[item_data['product'].id] += item_data['quantity']
+            alert_on_low_stock([(stock.quantity + taken[stock.product_id], stock.quantity) for stock in changed])
+
     def perform_update(self, serializer):
         with transaction.atomic():
-            order = serializer.instance
-            if serializer.validated_data.get('status') == 'FULFILLED' and order.status != 'FULFILLED':
-                if not order.warehouse:
-                    raise serializers.ValidationError('Warehouse is required for fulfilled orders.')
-                for item in order.items.all():
-                    stock = Stock.objects.select_for_update().get(warehouse=order.warehouse, product=item.product)
-                    if stock.quantity < item.quantity:
-                        raise serializers.ValidationError(f'Insufficient stock for {item.product.name}.')
-                    stock.quantity -= item.quantity
-                    stock.save()
-                    item.fulfilled_quantity = item.quantity
-                    item.save()
-                serializer.save()
+            # Lock the row so a concurrent PATCH or bulk transition sees the new status.
+            order = Order.objects.select_for_update().get(pk=serializer.instance.pk)
+            serializer.instance = order
+            warehouse = serializer.validated_data.get('warehouse', order.warehouse)
+            if warehouse != order.warehouse and order.items.exists():
+                # Its stock was taken from the current warehouse and is returned there on cancel.
+                raise serializers.ValidationError('Cannot move an order with items to another warehouse.')
+            status = serializer.validated_data.get('status', order.status)
+            changed = []
+            if status != order.status:
+                outcomes = {}
+                previous = order.status
+                moved, changed = transition_locked([order], status, outcomes)
+                if not moved:
+                    if outcomes[order.id] == NO_WAREHOUSE:
+                        raise serializers.ValidationError('Warehouse is required for fulfilled orders.')
+                    if outcomes[order.id] == MISSING_STOCK:
+                        raise serializers.ValidationError('Cannot cancel: a stock row this order reserved from no longer exists.')
+                    raise serializers.ValidationError(f'Cannot change order status from {previous} to {status}.')
+            order = serializer.save()
+            record(order_event(order, 'order.updated'), *[stock_event(stock) for stock in changed])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            record(order_event(instance, 'order.deleted'))
+            instance.delete()
+
+    @action(detail=False, methods=['post'])
+    def bulk_transition(self, request):
+        """Move many orders to one status: ``{"ids": [...], "status": "CANCELLED"}``.
+
+        Cancelling returns the quantities reserved at creation to stock; fulfilling
+        records them as delivered. Each order gets its own outcome; orders that
+        cannot move are left unchanged.
+        """
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        outcomes = bulk_transition(self.get_queryset(), serializer.validated_data['ids'], serializer.validated_data['status'])
+        return Response({
+            'status': serializer.validated_data['status'],
+            'transitioned': sum(outcome == TRANSITIONED for outcome in outcomes.values()),
+            'results': {str(order_id): outcome for order_id, outcome in outcomes.items()},
+        })
 
     @action(detail=False, methods=['get'])
     def export_orders(self, request):
-        queryset = self.get_queryset()
+        """CSV by default; with ``Accept: application/msgpack`` a streamed MessagePack row per order."""
+        queryset = (
+            self.get_queryset()
+            .select_related('user', 'warehouse')
+            .annotate(total_items=Coalesce(Sum('items__quantity'), 0))
+            .order_by('id')
+        )
+        if request.accepted_renderer.format == 'msgpack':
+            # The stream is consumed after this view returns, so fix the database now
+            # while the replica routing for this request is still in effect.
+            queryset = queryset.using(router.db_for_read(Order))
+            rows = (
+                {
+                    'id': order.id,
+                    'user': order.user.username,
+                    'warehouse': order.warehouse.name if order.warehouse else '',
+                    'status': order.status,
+                    'created_at': order.created_at,
+                    'total_items': order.total_items,
+                }
+                for order in queryset.iterator(chunk_size=2000)
+            )
+            response = StreamingHttpResponse(iter_encode(rows), content_type='application/msgpack')
+            response['Content-Disposition'] = 'attachment; filename="orders.msgpack"'
+            return response
+
         response = HttpResponse(content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="orders.csv"'
         writer = csv.writer(response)
         writer.writerow(['ID', 'User', 'Warehouse', 'Status', 'Created At', 'Total Items'])
         for order in queryset:
-            total_items = order.items.aggregate(Sum('quantity'))['quantity__sum'] or 0
             warehouse_name = order.warehouse.name if order.warehouse else ''
-            writer.writerow([order.id, order.user.username, warehouse_name, order.status, order.created_at, total_items])
+            writer.writerow([order.id, order.user.username, warehouse_name, order.status, order.created_at, order.total_items])
         return response
+
+class ArchivedOrderViewSet(ReplicaReadMixin, SparseQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = ArchivedOrderSerializer
+    permission_classes = [IsAuthenticated]
+    filterset_fields = {
+        'status': ['exact'],
+        'warehouse': ['exact'],
+        'created_at': ['gte', 'lt'],
+    }
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return ArchivedOrder.objects.all()
+        return ArchivedOrder.objects.filter(user=self.request.user)
+
+
+class EventFeedViewSet(ReplicaReadMixin, viewsets.GenericViewSet):
+    """Published outbox events, paged by offset: ``?offset=<last seen>&limit=<n>``."""
+    serializer_class = OutboxEventSerializer
+    permission_classes = [IsAuthenticated]
+    max_limit = 1000
+
+    def list(self, request):
+        offset, limit = _paging_params(request, 'offset', self.max_limit)
+        events = OutboxEvent.objects.filter(position__gt=offset)
+        if not request.user.is_staff:
+            # Same visibility as the list endpoints: all stock, but only the user's own orders.
+            events = events.filter(Q(order_id__isnull=True) | Q(payload__user=request.user.id))
+        events = events.order_by('position')[:limit]
+        data = self.get_serializer(events, many=True).data
+        next_offset = data[-1]['offset'] if data else offset
+        return Response({'next_offset': next_offset, 'events': data})
+
+
+class ReorderSuggestionViewSet(ReplicaReadMixin, SparseQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = ReorderSuggestion.objects.all()
+    serializer_class = ReorderSuggestionSerializer
+    permission_classes = [IsAuthenticated]
+    filterset_fields = {
+        'warehouse': ['exact'],
+        'product': ['exact'],
+        'suggested_quantity': ['gte'],
+    }
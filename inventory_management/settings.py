@@ -1,5 +1,7 @@
 import os
 from pathlib import Path
+from celery.schedules import crontab
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -78,6 +80,28 @@ DATABASES = {
     }
 }
 
+# Optional read replicas, e.g. DB_REPLICA_HOSTS=replica1.internal,replica2.internal.
+# In tests they mirror the default database.
+for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica{index + 1}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['inventory.routers.PrimaryReplicaRouter']
+# How long a user's reads stay on the primary after they write.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# Shared cache for replica pinning and availability lookups; falls back to per-process memory.
+if os.getenv('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL'),
+        }
+    }
+elif DATABASE_REPLICAS:
+    # A per-process cache would forget a user's pin as soon as their next request hits another worker.
+    raise ImproperlyConfigured('DB_REPLICA_HOSTS requires CACHE_URL so read-your-writes pinning is shared by all workers.')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -127,6 +151,17 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'inventory.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'inventory.parsers.MessagePackParser',
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
@@ -141,6 +176,49 @@ CELERY_RESULT_BACKEND = CELERY_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'archive-old-orders': {
+        'task': 'inventory.tasks.archive_old_orders',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'relay-outbox': {
+        'task': 'inventory.tasks.relay_outbox',
+        'schedule': 5.0,
+    },
+    'compute-reorder-suggestions': {
+        'task': 'inventory.tasks.compute_reorder_suggestions',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
+
+# Stock writes that take a quantity from above this to at or below it queue a low-stock alert.
+LOW_STOCK_ALERT_THRESHOLD = int(os.getenv('LOW_STOCK_ALERT_THRESHOLD', 10))
+
+# Closed orders older than this are moved to the ArchivedOrder cold table.
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', 365))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv('ORDER_ARCHIVE_BATCH_SIZE', 1000))
+
+# Dotted path to a callable receiving each relayed batch of serialized events, or empty
+# to only serve them from /api/events/.
+OUTBOX_PUBLISHER = os.getenv('OUTBOX_PUBLISHER', '')
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv('OUTBOX_RELAY_BATCH_SIZE', 5000))
+
+# Upper bound on lines per /api/stocks/availability/ call, and how long resolved
+# stock levels may be served from the cache (0 disables caching).
+STOCK_AVAILABILITY_MAX_ITEMS = int(os.getenv('STOCK_AVAILABILITY_MAX_ITEMS', 5000))
+STOCK_AVAILABILITY_CACHE_SECONDS = int(os.getenv('STOCK_AVAILABILITY_CACHE_SECONDS', 0))
+
+# Demand forecasting: days of order history, moving-average window, exponential
+# smoothing factor, and the days of demand a reorder should cover.
+FORECAST_HISTORY_DAYS = int(os.getenv('FORECAST_HISTORY_DAYS', 90))
+FORECAST_WINDOW_DAYS = int(os.getenv('FORECAST_WINDOW_DAYS', 28))
+FORECAST_SMOOTHING = float(os.getenv('FORECAST_SMOOTHING', 0.3))
+REORDER_LEAD_TIME_DAYS = int(os.getenv('REORDER_LEAD_TIME_DAYS', 7))
+REORDER_REVIEW_DAYS = int(os.getenv('REORDER_REVIEW_DAYS', 7))
+
+# Order ids accepted per /api/orders/bulk_transition/ call, and how many share a transaction.
+ORDER_BULK_TRANSITION_MAX_IDS = int(os.getenv('ORDER_BULK_TRANSITION_MAX_IDS', 10000))
+ORDER_BULK_TRANSITION_CHUNK_SIZE = int(os.getenv('ORDER_BULK_TRANSITION_CHUNK_SIZE', 1000))
 
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend' #For testing
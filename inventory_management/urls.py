@@ -3,13 +3,16 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenVerifyView, TokenObtainPairView, TokenRefreshView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
-from inventory.views import WarehouseViewSet, ProductViewSet,StockViewSet,OrderViewSet
+from inventory.views import WarehouseViewSet, ProductViewSet,StockViewSet,OrderViewSet, ArchivedOrderViewSet, EventFeedViewSet, ReorderSuggestionViewSet
 
 router = DefaultRouter()
 router.register(r'warehouses', WarehouseViewSet,basename='warehouse')
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'stocks', StockViewSet, basename='stock')
+router.register(r'archived-orders', ArchivedOrderViewSet, basename='archived-order')
+router.register(r'events', EventFeedViewSet, basename='event')
+router.register(r'reorder-suggestions', ReorderSuggestionViewSet, basename='reorder-suggestion')
 
 
 urlpatterns = [